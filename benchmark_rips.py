@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from rips_lote import generar_lote
+from rips_streaming import procesar_rips
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ⏱️ Benchmarks de los procesos RIPS sobre archivos sintéticos
+#
+#   python benchmark_rips.py streaming --gb 1 2 5
+#   python benchmark_rips.py lote --facturas 100000
+#
+# Los archivos se escriben por partes, así que generarlos tampoco necesita
+# tener el documento completo en memoria.
+
+CUPS = ["240200", "232102", "997301", "931001", "814731", "890203", "890303"]
+DIAGNOSTICOS = ["K053", "K020", "K036", "M751", "M754", "M239", "Z012"]
+PRESTADORES = ["110011599301", "110010231001", "110010136201"]
+
+
+def procedimiento_sintetico(rnd, consecutivo):
+    return {
+        "codPrestador": rnd.choice(PRESTADORES),
+        "fechaInicioAtencion": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00",
+        "idMIPRES": "",
+        "numAutorizacion": str(rnd.randint(10**12, 10**13 - 1)),
+        "codProcedimiento": rnd.choice(CUPS),
+        "viaIngresoServicioSalud": "01",
+        "modalidadGrupoServicioTecSal": "01",
+        "grupoServicios": "01",
+        "codServicio": 739,
+        "finalidadTecnologiaSalud": "16",
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": "51938676",
+        "codDiagnosticoPrincipal": rnd.choice(DIAGNOSTICOS),
+        "codDiagnosticoRelacionado": None,
+        "codComplicacion": None,
+        "vrServicio": rnd.randint(0, 300) * 1000,
+        "conceptoRecaudo": "05",
+        "valorPagoModerador": rnd.choice((0, 0, 0, 4500)),
+        "numFEVPagoModerador": "",
+        "consecutivo": consecutivo,
+    }
+
+
+def usuario_sintetico(rnd, consecutivo):
+    return {
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": str(rnd.randint(10**7, 10**10)),
+        "tipoUsuario": "11",
+        "fechaNacimiento": f"{rnd.randint(1940, 2020)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+        "codSexo": rnd.choice("FM"),
+        "codPaisResidencia": "170",
+        "codMunicipioResidencia": "11001",
+        "codZonaTerritorialResidencia": "02",
+        "incapacidad": "NO",
+        "codPaisOrigen": "170",
+        "consecutivo": consecutivo,
+    }
+
+
+def generar_rips_sintetico(ruta, tamano_bytes, semilla=0):
+    """Escribe un RIPS válido de aproximadamente ``tamano_bytes`` en ``ruta``."""
+    rnd = random.Random(semilla)
+    escritos = 0
+    with open(ruta, "w", encoding="utf-8") as f:
+        encabezado = json.dumps({
+            "numDocumentoIdObligado": "51938676",
+            "numFactura": "SVER238",
+            "tipoNota": "",
+            "numNota": "",
+        }, ensure_ascii=False)
+        escritos += f.write(encabezado[:-1] + ', "usuarios": [')
+        consecutivo = 0
+        while escritos < tamano_bytes:
+            consecutivo += 1
+            usuario = usuario_sintetico(rnd, consecutivo)
+            procedimientos = [procedimiento_sintetico(rnd, i + 1) for i in range(rnd.randint(1, 20))]
+            usuario["servicios"] = {"procedimientos": procedimientos}
+            if consecutivo > 1:
+                escritos += f.write(",\n")
+            escritos += f.write(json.dumps(usuario, ensure_ascii=False))
+        f.write("]}\n")
+
+
+def _memoria_pico_mb():
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_streaming(tamanos_gb, directorio):
+    for gb in tamanos_gb:
+        ruta = os.path.join(directorio, f"rips_sintetico_{gb}gb.json")
+        print(f"📝 Generando {ruta} ({gb} GB)...")
+        generar_rips_sintetico(ruta, int(gb * 1024**3))
+        tamano_mb = os.path.getsize(ruta) / 1024**2
+
+        inicio = time.perf_counter()
+        resultado = procesar_rips(ruta)
+        duracion = time.perf_counter() - inicio
+
+        memoria = _memoria_pico_mb()
+        print(f"  Usuarios: {resultado['num_usuarios']:,}  Procedimientos: {resultado['num_procedimientos']:,}")
+        print(f"  Tiempo: {duracion:.1f} s  ({tamano_mb / duracion:.1f} MB/s, "
+              f"{resultado['num_procedimientos'] / duracion:,.0f} procedimientos/s)")
+        if memoria is not None:
+            print(f"  Memoria pico del proceso: {memoria:.0f} MB")
+        os.remove(ruta)
+
+
+def factura_sintetica(numero, cambio=0):
+    """Factura FEV con filas en el formato de las hojas de Excel.
+
+    Con el mismo ``numero`` y ``cambio`` siempre produce la misma factura.
+    """
+    rnd = random.Random(numero)
+    usuarios = []
+    procedimientos = []
+    for _ in range(rnd.randint(1, 5)):
+        usuario = usuario_sintetico(rnd, 0)
+        usuarios.append({
+            "tipoDocumento": usuario["tipoDocumentoIdentificacion"],
+            "numDocumento": usuario["numDocumentoIdentificacion"],
+            "fechaNacimiento": usuario["fechaNacimiento"],
+            "codSexo": usuario["codSexo"],
+            "PaisResidencia": "170",
+            "MunicipioResidencia": "11001",
+            "ZonaResidencia": "02",
+            "PaisOrigen": "170",
+        })
+        for _ in range(rnd.randint(1, 4)):
+            procedimiento = procedimiento_sintetico(rnd, 0)
+            procedimientos.append({
+                "IDPaciente": usuario["numDocumentoIdentificacion"],
+                "fechaInicioAtencion": procedimiento["fechaInicioAtencion"],
+                "numAutorizacion": procedimiento["numAutorizacion"],
+                "CUPS": procedimiento["codProcedimiento"],
+                "codServicio": procedimiento["codServicio"],
+                "CIE10_Principal": procedimiento["codDiagnosticoPrincipal"],
+                "CIE10_relacionado": None,
+                "vrServicio": procedimiento["vrServicio"] + cambio,
+                "valorPagoModerador": procedimiento["valorPagoModerador"],
+            })
+    return {
+        "numDocumentoIdObligado": "51938676",
+        "codPrestador": rnd.choice(PRESTADORES),
+        "numFactura": f"SVER{numero}",
+        "usuarios": usuarios,
+        "procedimientos": procedimientos,
+    }
+
+
+def benchmark_lote(num_facturas, procesos, porcentaje_cambios, directorio):
+    dir_salida = tempfile.mkdtemp(prefix="rips_lote_", dir=directorio)
+    cada = max(1, round(100 / porcentaje_cambios)) if porcentaje_cambios else 0
+
+    def facturas(corrida):
+        for numero in range(num_facturas):
+            cambio = corrida if cada and numero % cada == 0 else 0
+            yield factura_sintetica(numero, cambio)
+
+    try:
+        for corrida, titulo in ((0, "en frío"), (1, f"con {porcentaje_cambios}% de facturas modificadas")):
+            inicio = time.perf_counter()
+            resumen = generar_lote(facturas(corrida), dir_salida, procesos=procesos)
+            duracion = time.perf_counter() - inicio
+            print(f"📦 Corrida {titulo}: {num_facturas:,} facturas en {duracion:.1f} s "
+                  f"({num_facturas / duracion:,.0f} documentos/s)")
+            print(f"  Generados: {resumen['generados']:,}  Sin cambios: {resumen['sin_cambios']:,}  "
+                  f"Fragmentos nuevos: {resumen['fragmentos_nuevos']:,}  "
+                  f"reutilizados: {resumen['fragmentos_reutilizados']:,}")
+    finally:
+        shutil.rmtree(dir_salida)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de procesos RIPS")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    streaming = subparsers.add_parser("streaming", help="Lectura, validación y totales en streaming")
+    streaming.add_argument("--gb", type=float, nargs="+", default=[1, 2, 5])
+    streaming.add_argument("--dir", default=tempfile.gettempdir())
+
+    lote = subparsers.add_parser("lote", help="Generación de RIPS por lotes desde facturas")
+    lote.add_argument("--facturas", type=int, default=100_000)
+    lote.add_argument("--procesos", type=int, default=None)
+    lote.add_argument("--cambios", type=float, default=1, help="Porcentaje de facturas modificadas en la segunda corrida")
+    lote.add_argument("--dir", default=tempfile.gettempdir())
+
+    args = parser.parse_args()
+    if args.benchmark == "streaming":
+        benchmark_streaming(args.gb, args.dir)
+    elif args.benchmark == "lote":
+        benchmark_lote(args.facturas, args.procesos, args.cambios, args.dir)
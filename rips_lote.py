@@ -0,0 +1,467 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+# 📦 Generación de RIPS por lotes a partir de facturas FEV y notas
+#
+# Cada factura (o nota) es un diccionario con filas por hoja:
+#
+#   {
+#       "numDocumentoIdObligado": ..., "codPrestador": ...,
+#       "numFactura": ...,                 # FEV (vacío en notas RS sin FEV)
+#       "tipoNota": ..., "numNota": ...,   # solo en notas (RS, NC, ND, ...)
+#       "usuarios": [...],
+#       "consultas": [...],                # opcional
+#       "procedimientos": [...],           # opcional
+#   }
+#
+# Columnas de cada fila:
+#   usuarios:       tipoDocumento, numDocumento, fechaNacimiento, codSexo,
+#                   PaisResidencia, MunicipioResidencia, ZonaResidencia,
+#                   PaisOrigen
+#   consultas:      IDPaciente, fechaInicioAtencion, numAutorizacion, CUPS,
+#                   codServicio, finalidadTecnologiaSalud,
+#                   causaMotivoAtencion, CIE10_Principal,
+#                   CIE10_relacionado1..3 (opcionales),
+#                   tipoDiagnosticoPrincipal, vrServicio, valorPagoModerador
+#   procedimientos: IDPaciente, fechaInicioAtencion, numAutorizacion, CUPS,
+#                   codServicio, CIE10_Principal, CIE10_relacionado
+#                   (opcional), vrServicio, valorPagoModerador
+#
+# Es nota si trae tipoNota o numNota; su archivo se llama
+# <tipoNota>_<numNota>.json aunque también traiga numFactura (que se conserva
+# en el encabezado). Las facturas se guardan como <numFactura>.json.
+#
+# IDPaciente es el numDocumento del usuario al que pertenece el servicio.
+# Las fechas pueden ser texto ISO o datetime. En las notas sin numFactura (RS
+# sin FEV) los valores, numAutorizacion y demás campos de cobro se dejan en
+# cero o vacíos.
+# factura_desde_excel() arma este diccionario desde un Excel con las hojas
+# TRANSACCION, USUARIOS, CONSULTAS y PROCEDIMIENTOS.
+#
+# Las facturas se reparten entre procesos. Cada usuario y cada servicio se
+# serializa una sola vez y se guarda en una caché SQLite indexada por el hash
+# de su contenido; en una nueva corrida solo se reconstruyen los registros que
+# cambiaron y las facturas que no cambiaron ni se vuelven a escribir.
+# El consecutivo se asigna al escribir, según el orden de las filas.
+
+SEPARADORES = (",", ":")
+# Subir este número al cambiar construir_* o el formato de salida: invalida
+# todas las huellas de la caché
+VERSION_FORMATO = 2
+TAMANO_TANDA = 1000  # facturas enviadas al pool por tanda
+
+_cache_lectura = None
+
+
+# 🧩 Funciones auxiliares
+
+def _es_nulo(valor):
+    # NaN es el único valor distinto de sí mismo
+    return valor is None or valor != valor or (isinstance(valor, str) and valor.lower() == "nan")
+
+
+def _texto(valor):
+    return None if _es_nulo(valor) else str(valor)
+
+
+def _numero(valor):
+    if _es_nulo(valor):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def _fecha(valor, formato):
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.strftime(formato)
+
+
+def _huella(*partes):
+    contenido = json.dumps((VERSION_FORMATO,) + partes, sort_keys=True, ensure_ascii=False, separators=SEPARADORES, default=str)
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def _tiene_valor(valor):
+    return not _es_nulo(valor) and str(valor).strip() != ""
+
+
+def es_nota(factura):
+    return _tiene_valor(factura.get("tipoNota")) or _tiene_valor(factura.get("numNota"))
+
+
+def es_sin_fev(factura):
+    # Nota RS sin factura electrónica: sin valores ni autorizaciones
+    return es_nota(factura) and not _tiene_valor(factura.get("numFactura"))
+
+
+def _tipo_nota(factura):
+    tipo_nota = factura.get("tipoNota")
+    return str(tipo_nota) if _tiene_valor(tipo_nota) else "RS"
+
+
+def nombre_documento(factura):
+    if es_nota(factura):
+        if not _tiene_valor(factura.get("numNota")):
+            raise ValueError(f"nota {_tipo_nota(factura)} sin numNota")
+        nombre = f"{_tipo_nota(factura)}_{factura['numNota']}"
+    elif _tiene_valor(factura.get("numFactura")):
+        nombre = str(factura["numFactura"])
+    else:
+        raise ValueError("factura sin numFactura ni numNota")
+    if "/" in nombre or "\\" in nombre or ".." in nombre:
+        raise ValueError(f"nombre de documento inválido: {nombre!r}")
+    return nombre
+
+
+# 🧱 Construcción de fragmentos (sin consecutivo)
+
+def construir_usuario(fila, sin_fev):
+    return {
+        "tipoDocumentoIdentificacion": fila["tipoDocumento"],
+        "numDocumentoIdentificacion": str(fila["numDocumento"]),
+        "tipoUsuario": "12" if sin_fev else "11",
+        "fechaNacimiento": _fecha(fila["fechaNacimiento"], "%Y-%m-%d"),
+        "codSexo": str(fila["codSexo"]),
+        "codPaisResidencia": str(fila["PaisResidencia"]),
+        "codMunicipioResidencia": str(fila["MunicipioResidencia"]),
+        "codZonaTerritorialResidencia": str(fila["ZonaResidencia"]),
+        "incapacidad": "NO",
+        "codPaisOrigen": str(fila["PaisOrigen"]),
+    }
+
+
+def construir_consulta(fila, sin_fev, cod_prestador, num_documento_obligado):
+    return {
+        "codPrestador": cod_prestador,
+        "fechaInicioAtencion": _fecha(fila["fechaInicioAtencion"], "%Y-%m-%d %H:%M"),
+        "numAutorizacion": "" if sin_fev else _texto(fila["numAutorizacion"]),
+        "codConsulta": str(fila["CUPS"]),
+        "modalidadGrupoServicioTecSal": "01",
+        "grupoServicios": "01",
+        "codServicio": _numero(fila["codServicio"]),
+        "finalidadTecnologiaSalud": str(fila["finalidadTecnologiaSalud"]),
+        "causaMotivoAtencion": str(fila["causaMotivoAtencion"]),
+        "codDiagnosticoPrincipal": str(fila["CIE10_Principal"]),
+        "codDiagnosticoRelacionado1": _texto(fila.get("CIE10_relacionado1")),
+        "codDiagnosticoRelacionado2": _texto(fila.get("CIE10_relacionado2")),
+        "codDiagnosticoRelacionado3": _texto(fila.get("CIE10_relacionado3")),
+        "tipoDiagnosticoPrincipal": str(fila["tipoDiagnosticoPrincipal"]),
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": num_documento_obligado,
+        "vrServicio": 0 if sin_fev else _numero(fila["vrServicio"]),
+        "valorPagoModerador": 0 if sin_fev else _numero(fila["valorPagoModerador"]),
+        "conceptoRecaudo": "05" if sin_fev else "03",
+        "numFEVPagoModerador": "",
+    }
+
+
+def construir_procedimiento(fila, sin_fev, cod_prestador, num_documento_obligado):
+    return {
+        "codPrestador": cod_prestador,
+        "fechaInicioAtencion": _fecha(fila["fechaInicioAtencion"], "%Y-%m-%d %H:%M"),
+        "idMIPRES": "" if sin_fev else None,
+        "numAutorizacion": "" if sin_fev else _texto(fila["numAutorizacion"]),
+        "codProcedimiento": str(fila["CUPS"]),
+        "viaIngresoServicioSalud": "01",
+        "modalidadGrupoServicioTecSal": "01",
+        "grupoServicios": "01",
+        "codServicio": _numero(fila["codServicio"]),
+        "finalidadTecnologiaSalud": "15" if sin_fev else "16",
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": num_documento_obligado,
+        "codDiagnosticoPrincipal": str(fila["CIE10_Principal"]),
+        "codDiagnosticoRelacionado": _texto(fila.get("CIE10_relacionado")),
+        "codComplicacion": None,
+        "vrServicio": 0 if sin_fev else _numero(fila["vrServicio"]),
+        "conceptoRecaudo": "05",
+        "valorPagoModerador": 0 if sin_fev else _numero(fila["valorPagoModerador"]),
+        "numFEVPagoModerador": "",
+    }
+
+
+CONSTRUCTORES_SERVICIO = {
+    "consultas": construir_consulta,
+    "procedimientos": construir_procedimiento,
+}
+
+
+# 🗄️ Caché de fragmentos
+
+def abrir_cache(ruta):
+    conexion = sqlite3.connect(ruta)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("CREATE TABLE IF NOT EXISTS fragmentos (huella TEXT PRIMARY KEY, json TEXT NOT NULL)")
+    conexion.execute("CREATE TABLE IF NOT EXISTS documentos (nombre TEXT PRIMARY KEY, huella TEXT NOT NULL)")
+    # Fragmentos que usa cada documento, para poder limpiar los que ya nadie usa
+    conexion.execute("CREATE TABLE IF NOT EXISTS usos (nombre TEXT NOT NULL, huella TEXT NOT NULL)")
+    conexion.execute("CREATE INDEX IF NOT EXISTS usos_nombre ON usos (nombre)")
+    conexion.execute("CREATE INDEX IF NOT EXISTS usos_huella ON usos (huella)")
+    conexion.commit()
+    return conexion
+
+
+def limpiar_cache(conexion, nombres_vigentes):
+    """Olvida los documentos que no están en ``nombres_vigentes`` y borra los
+    fragmentos que ya no usa ningún documento. Devuelve cuántos se borraron."""
+    conexion.execute("CREATE TEMP TABLE IF NOT EXISTS vigentes (nombre TEXT PRIMARY KEY)")
+    conexion.execute("DELETE FROM vigentes")
+    conexion.executemany("INSERT OR IGNORE INTO vigentes VALUES (?)", ((nombre,) for nombre in nombres_vigentes))
+    conexion.execute("DELETE FROM documentos WHERE nombre NOT IN (SELECT nombre FROM vigentes)")
+    conexion.execute("DELETE FROM usos WHERE nombre NOT IN (SELECT nombre FROM documentos)")
+    borrados = conexion.execute(
+        "DELETE FROM fragmentos WHERE huella NOT IN (SELECT huella FROM usos)"
+    ).rowcount
+    conexion.execute("DROP TABLE vigentes")
+    conexion.commit()
+    return borrados
+
+
+def _iniciar_trabajador(ruta_cache):
+    global _cache_lectura
+    _cache_lectura = sqlite3.connect(Path(ruta_cache).absolute().as_uri() + "?mode=ro", uri=True)
+
+
+def _buscar_fragmentos(cache, huellas):
+    encontrados = {}
+    huellas = list(huellas)
+    # SQLite limita la cantidad de parámetros por consulta
+    for i in range(0, len(huellas), 500):
+        parte = huellas[i:i + 500]
+        marcas = ",".join("?" * len(parte))
+        encontrados.update(cache.execute(f"SELECT huella, json FROM fragmentos WHERE huella IN ({marcas})", parte))
+    return encontrados
+
+
+# ✍️ Generación de un documento
+
+def _escribir_documento(ruta, encabezado, usuarios, servicios_por_usuario):
+    # usuarios[i] es el JSON del usuario y servicios_por_usuario[i] sus servicios por tipo
+    # Un temporal propio por escritura para que dos procesos nunca compartan archivo
+    f = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(ruta), suffix=".tmp", delete=False)
+    temporal = f.name
+    try:
+        with f:
+            f.write(json.dumps(encabezado, ensure_ascii=False, separators=SEPARADORES)[:-1])
+            f.write(',"usuarios":[')
+            for i, (usuario_json, servicios) in enumerate(zip(usuarios, servicios_por_usuario), start=1):
+                if i > 1:
+                    f.write(",")
+                f.write(usuario_json[:-1])
+                f.write(f',"consecutivo":{i}')
+                if servicios:
+                    f.write(',"servicios":{')
+                    primero = True
+                    for tipo in CONSTRUCTORES_SERVICIO:
+                        lista = servicios.get(tipo)
+                        if not lista:
+                            continue
+                        if not primero:
+                            f.write(",")
+                        primero = False
+                        f.write(f'"{tipo}":[')
+                        f.write(",".join(
+                            f'{servicio_json[:-1]},"consecutivo":{n}}}'
+                            for n, servicio_json in enumerate(lista, start=1)
+                        ))
+                        f.write("]")
+                    f.write("}")
+                f.write("}")
+            f.write("]}\n")
+        os.replace(temporal, ruta)
+    except BaseException:
+        # No dejar temporales huérfanos si falla la escritura (disco lleno, permisos...)
+        os.unlink(temporal)
+        raise
+
+
+def generar_documento(factura, dir_salida, cache):
+    """Genera el RIPS de una factura o nota reutilizando fragmentos de la caché.
+
+    Devuelve (nombre, huella, fragmentos_nuevos, huellas_usadas, reutilizados,
+    advertencias); fragmentos_nuevos es None si el documento no cambió desde la
+    última corrida.
+    """
+    nombre = nombre_documento(factura)
+    ruta = os.path.join(dir_salida, f"{nombre}.json")
+    huella = _huella(factura)
+    anterior = cache.execute("SELECT huella FROM documentos WHERE nombre = ?", (nombre,)).fetchone()
+    if anterior and anterior[0] == huella and os.path.exists(ruta):
+        return nombre, huella, None, [], 0, []
+
+    nota = es_nota(factura)
+    sin_fev = es_sin_fev(factura)
+    cod_prestador = str(factura["codPrestador"])
+    num_documento_obligado = str(factura["numDocumentoIdObligado"])
+
+    # Calcular las huellas de todas las filas y consultar la caché de una vez
+    filas = []
+    for fila in factura.get("usuarios", []):
+        filas.append(("usuarios", fila, _huella("usuario", sin_fev, fila)))
+    for tipo in CONSTRUCTORES_SERVICIO:
+        for fila in factura.get(tipo, []):
+            filas.append((tipo, fila, _huella(tipo, sin_fev, cod_prestador, num_documento_obligado, fila)))
+    en_cache = _buscar_fragmentos(cache, {h for _, _, h in filas})
+
+    nuevos = {}
+    usuarios = []
+    servicios_por_usuario = []
+    indice_usuario = {}
+    advertencias = []
+    for tipo, fila, huella_fila in filas:
+        fragmento = en_cache.get(huella_fila) or nuevos.get(huella_fila)
+        if fragmento is None:
+            if tipo == "usuarios":
+                registro = construir_usuario(fila, sin_fev)
+            else:
+                registro = CONSTRUCTORES_SERVICIO[tipo](fila, sin_fev, cod_prestador, num_documento_obligado)
+            fragmento = json.dumps(registro, ensure_ascii=False, separators=SEPARADORES)
+            nuevos[huella_fila] = fragmento
+
+        if tipo == "usuarios":
+            indice_usuario[str(fila["numDocumento"])] = len(usuarios)
+            usuarios.append(fragmento)
+            servicios_por_usuario.append({})
+            continue
+        documento = str(fila["IDPaciente"])
+        if documento not in indice_usuario:
+            advertencias.append(f"⚠️ {nombre}: usuario no encontrado para {tipo[:-1]}: {documento}")
+            continue
+        servicios_por_usuario[indice_usuario[documento]].setdefault(tipo, []).append(fragmento)
+
+    encabezado = {
+        "numDocumentoIdObligado": num_documento_obligado,
+        "numFactura": str(factura["numFactura"]) if _tiene_valor(factura.get("numFactura")) else None,
+        "tipoNota": _tipo_nota(factura) if nota else "",
+        "numNota": str(factura["numNota"]) if nota else "",
+    }
+    _escribir_documento(ruta, encabezado, usuarios, servicios_por_usuario)
+    usadas = {h for _, _, h in filas}
+    reutilizados = len(filas) - len(nuevos)
+    return nombre, huella, list(nuevos.items()), list(usadas), reutilizados, advertencias
+
+
+def _generar_en_trabajador(argumentos):
+    factura, dir_salida = argumentos
+    # Un error en una factura no debe detener el resto del lote
+    try:
+        return generar_documento(factura, dir_salida, _cache_lectura), None
+    except KeyError as e:
+        return None, f"columna faltante {e}"
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+# 🚀 Generación del lote
+
+def generar_lote(facturas, dir_salida, ruta_cache=None, procesos=None, tamano_tanda=TAMANO_TANDA,
+                 limpiar=True):
+    """Genera un RIPS por factura/nota en ``dir_salida`` usando un pool de procesos.
+
+    ``facturas`` puede ser cualquier iterable (incluso un generador): se envía
+    al pool por tandas, así que no hace falta tenerlo completo en memoria.
+    Las facturas repetidas (mismo nombre de documento) se omiten con una
+    advertencia y las que fallan quedan en "errores" sin detener el lote.
+    Con ``limpiar`` la caché se queda solo con los documentos de esta corrida.
+    Devuelve un resumen con los documentos generados y reutilizados.
+    """
+    os.makedirs(dir_salida, exist_ok=True)
+    ruta_cache = ruta_cache or os.path.join(dir_salida, ".rips_cache.sqlite")
+    cache = abrir_cache(ruta_cache)
+    resumen = {
+        "generados": 0,
+        "sin_cambios": 0,
+        "fragmentos_nuevos": 0,
+        "fragmentos_reutilizados": 0,
+        "fragmentos_borrados": 0,
+        "advertencias": [],
+        "errores": [],
+    }
+    vistos = set()
+
+    facturas = iter(facturas)
+    procesos = procesos or os.cpu_count() or 1
+    chunksize = max(1, tamano_tanda // (4 * procesos))
+    with ProcessPoolExecutor(procesos, initializer=_iniciar_trabajador, initargs=(ruta_cache,)) as pool:
+        while True:
+            leidas = list(islice(facturas, tamano_tanda))
+            if not leidas:
+                break
+            tanda = []
+            nombres = []
+            for factura in leidas:
+                try:
+                    nombre = nombre_documento(factura)
+                except (KeyError, TypeError, AttributeError, ValueError) as e:
+                    resumen["errores"].append(f"❌ Factura inválida: {e}")
+                    continue
+                if nombre in vistos:
+                    resumen["advertencias"].append(f"⚠️ {nombre}: documento repetido en el lote, se omite")
+                    continue
+                vistos.add(nombre)
+                tanda.append((factura, dir_salida))
+                nombres.append(nombre)
+            resultados = pool.map(_generar_en_trabajador, tanda, chunksize=chunksize)
+            for nombre, (resultado, error) in zip(nombres, resultados):
+                if error is not None:
+                    resumen["errores"].append(f"❌ {nombre}: {error}")
+                    continue
+                nombre, huella, nuevos, usadas, reutilizados, advertencias = resultado
+                resumen["advertencias"].extend(advertencias)
+                if nuevos is None:
+                    resumen["sin_cambios"] += 1
+                    continue
+                resumen["generados"] += 1
+                resumen["fragmentos_nuevos"] += len(nuevos)
+                resumen["fragmentos_reutilizados"] += reutilizados
+                cache.executemany("INSERT OR REPLACE INTO fragmentos VALUES (?, ?)", nuevos)
+                cache.execute("INSERT OR REPLACE INTO documentos VALUES (?, ?)", (nombre, huella))
+                cache.execute("DELETE FROM usos WHERE nombre = ?", (nombre,))
+                cache.executemany("INSERT INTO usos VALUES (?, ?)", ((nombre, h) for h in usadas))
+            cache.commit()
+    if limpiar:
+        resumen["fragmentos_borrados"] = limpiar_cache(cache, vistos)
+    cache.close()
+    return resumen
+
+
+def factura_desde_excel(archivo_excel):
+    """Lee un Excel con las hojas TRANSACCION, USUARIOS, CONSULTAS y PROCEDIMIENTOS."""
+    import pandas as pd
+
+    xls = pd.ExcelFile(archivo_excel)
+    transaccion = xls.parse("TRANSACCION").astype(object).to_dict("records")[0]
+    factura = {
+        "numDocumentoIdObligado": transaccion["numDocumentoIdObligado"],
+        "codPrestador": transaccion["codPrestador"],
+        "numFactura": _texto(transaccion.get("numFactura")),
+        "tipoNota": _texto(transaccion.get("tipoNota")),
+        "numNota": _texto(transaccion.get("numNota")),
+    }
+    for hoja, clave in (("USUARIOS", "usuarios"), ("CONSULTAS", "consultas"), ("PROCEDIMIENTOS", "procedimientos")):
+        if hoja in xls.sheet_names:
+            factura[clave] = xls.parse(hoja).astype(object).to_dict("records")
+    return factura
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("Uso: python rips_lote.py DIRECTORIO_SALIDA ARCHIVO.xlsx [ARCHIVO.xlsx ...]")
+        sys.exit(1)
+
+    resumen = generar_lote((factura_desde_excel(ruta) for ruta in sys.argv[2:]), sys.argv[1])
+    for mensaje in resumen["advertencias"] + resumen["errores"]:
+        print(mensaje)
+    print(f"✅ Documentos generados: {resumen['generados']}, sin cambios: {resumen['sin_cambios']}")
+    print(f"   Fragmentos nuevos: {resumen['fragmentos_nuevos']}, reutilizados: {resumen['fragmentos_reutilizados']}, "
+          f"borrados de la caché: {resumen['fragmentos_borrados']}")
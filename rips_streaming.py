@@ -0,0 +1,408 @@
+import json
+import math
+import re
+import codecs
+from datetime import date, datetime
+
+import numpy as np
+
+# 📥 Lectura incremental de documentos RIPS
+#
+# Los RIPS mensuales de un prestador grande pueden pesar varios GB, así que en
+# lugar de json.load() se recorre el archivo por bloques y solo se decodifica
+# (con json.JSONDecoder.raw_decode) un registro a la vez: cada usuario sin sus
+# servicios y cada servicio (procedimiento, consulta, ...) por separado.
+
+TAMANO_BLOQUE = 1 << 20  # 1 MB por lectura
+
+_decoder = json.JSONDecoder()
+_ESPACIOS = " \t\n\r"
+
+
+class ErrorFormatoRIPS(ValueError):
+    pass
+
+
+# Un error de sintaxis a menos de esta distancia del final del buffer puede
+# ser solo un valor cortado entre bloques (literal, número o escape \uXXXX)
+_MARGEN_CORTE = 16
+
+
+class _LectorJSON:
+    """Buffer de texto que se rellena desde el archivo a medida que se consume."""
+
+    def __init__(self, archivo, tamano_bloque=TAMANO_BLOQUE):
+        self.archivo = archivo
+        self.tamano_bloque = tamano_bloque
+        self.decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buf = ""
+        self.pos = 0
+        self.descartados = 0  # caracteres ya eliminados del inicio del buffer
+        self.eof = False
+
+    def _error(self, mensaje, pos=None):
+        posicion = self.descartados + (self.pos if pos is None else pos)
+        return ErrorFormatoRIPS(f"{mensaje} (caracter {posicion})")
+
+    def _rellenar(self):
+        if self.eof:
+            return False
+        # Descartar lo ya consumido para que el buffer no crezca sin límite
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.descartados += self.pos
+            self.pos = 0
+        datos = self.archivo.read(self.tamano_bloque)
+        try:
+            if not datos:
+                self.eof = True
+                self.buf += self.decodificador.decode(b"", final=True)
+                return False
+            self.buf += self.decodificador.decode(datos)
+        except UnicodeDecodeError as e:
+            raise self._error(f"UTF-8 inválido: {e.reason}", len(self.buf) + e.start) from None
+        return True
+
+    def siguiente(self):
+        """Salta espacios y devuelve (sin consumir) el siguiente caracter."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _ESPACIOS:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._rellenar() and self.pos >= len(self.buf):
+                return ""
+
+    def esperar(self, caracter):
+        actual = self.siguiente()
+        if actual != caracter:
+            raise self._error(f"Se esperaba '{caracter}' y se encontró '{actual or 'EOF'}'")
+        self.pos += 1
+
+    def valor(self):
+        """Decodifica el siguiente valor JSON completo (objeto, lista, texto o número)."""
+        self.siguiente()
+        while True:
+            try:
+                valor, fin = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Solo se lee otro bloque si el valor quedó cortado al final del
+                # buffer; un error de sintaxis en medio se reporta de inmediato
+                cortado = e.msg.startswith("Unterminated string") or len(self.buf) - e.pos < _MARGEN_CORTE
+                if cortado and self._rellenar():
+                    continue
+                raise self._error(f"JSON inválido: {e.msg}", e.pos) from None
+            # Un número al final del buffer puede continuar en el siguiente bloque
+            if fin == len(self.buf) and not self.eof:
+                self._rellenar()
+                continue
+            self.pos = fin
+            return valor
+
+    def claves(self):
+        """Recorre un objeto JSON y devuelve sus claves; el valor lo lee quien llama."""
+        self.esperar("{")
+        if self.siguiente() == "}":
+            self.pos += 1
+            return
+        while True:
+            clave = self.valor()
+            if not isinstance(clave, str):
+                raise self._error("Clave de objeto inválida")
+            self.esperar(":")
+            yield clave
+            caracter = self.siguiente()
+            self.pos += 1
+            if caracter == "}":
+                return
+            if caracter != ",":
+                raise self._error(f"Se esperaba ',' o '}}' y se encontró '{caracter or 'EOF'}'", self.pos - 1)
+
+    def elementos(self):
+        """Recorre una lista JSON; cada elemento lo lee quien llama."""
+        self.esperar("[")
+        if self.siguiente() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            caracter = self.siguiente()
+            self.pos += 1
+            if caracter == "]":
+                return
+            if caracter != ",":
+                raise self._error(f"Se esperaba ',' o ']' y se encontró '{caracter or 'EOF'}'", self.pos - 1)
+
+
+# 🧩 Recorrido del documento
+
+def _leer_usuario(lector):
+    usuario = {}
+    for clave in lector.claves():
+        if clave != "servicios" or lector.siguiente() != "{":
+            usuario[clave] = lector.valor()
+            continue
+        for tipo_servicio in lector.claves():
+            if lector.siguiente() != "[":
+                lector.valor()
+                continue
+            for _ in lector.elementos():
+                yield tipo_servicio, lector.valor()
+    yield "usuario", usuario
+
+
+def leer_rips(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Genera los registros de un RIPS sin cargar el documento completo.
+
+    Produce tuplas (tipo, registro):
+      - (nombre_servicio, servicio) por cada elemento de servicios.<nombre>[],
+        por ejemplo ("procedimientos", {...}), a medida que aparecen.
+      - ("usuario", usuario) al cerrar cada usuario, sin la clave "servicios".
+      - ("documento", encabezado) al final, con numDocumentoIdObligado,
+        numFactura, tipoNota, numNota, etc.
+
+    ``archivo`` puede ser una ruta o un archivo abierto en modo binario.
+    """
+    if isinstance(archivo, (str, bytes)) or hasattr(archivo, "__fspath__"):
+        with open(archivo, "rb") as f:
+            yield from leer_rips(f, tamano_bloque)
+        return
+
+    lector = _LectorJSON(archivo, tamano_bloque)
+    encabezado = {}
+    for clave in lector.claves():
+        if clave != "usuarios":
+            encabezado[clave] = lector.valor()
+            continue
+        for _ in lector.elementos():
+            if lector.siguiente() == "{":
+                yield from _leer_usuario(lector)
+            else:
+                # Se entrega tal cual para que la validación lo reporte
+                yield "usuario", lector.valor()
+    if lector.siguiente():
+        raise lector._error("Contenido adicional después del documento")
+    yield "documento", encabezado
+
+
+# ✅ Validación de códigos y fechas
+
+TIPOS_DOCUMENTO = {"CC", "CE", "CD", "PA", "SC", "PE", "PT", "RC", "TI", "CN", "AS", "MS", "DE", "SI"}
+TIPOS_USUARIO = {f"{n:02d}" for n in range(1, 13)}
+# Los generadores actuales usan F/M; la Resolución 2275 de 2023 usa H/M/I
+CODIGOS_SEXO = {"F", "M", "H", "I"}
+CONCEPTOS_RECAUDO = {"01", "02", "03", "04", "05"}
+
+_FORMATO_FECHA = re.compile(r"\d{4}-\d{2}-\d{2}")
+_FORMATO_FECHA_HORA = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}")
+
+
+def _fecha_valida(valor):
+    if not isinstance(valor, str) or not _FORMATO_FECHA.fullmatch(valor):
+        return False
+    try:
+        date.fromisoformat(valor)
+    except ValueError:
+        return False
+    return True
+
+
+def _fecha_hora_valida(valor):
+    if not isinstance(valor, str) or not _FORMATO_FECHA_HORA.fullmatch(valor):
+        return False
+    try:
+        datetime.fromisoformat(valor)
+    except ValueError:
+        return False
+    return True
+
+
+def validar_usuario(usuario):
+    if not isinstance(usuario, dict):
+        return [f"el usuario no es un objeto JSON: {usuario!r}"]
+    errores = []
+    if usuario.get("tipoDocumentoIdentificacion") not in TIPOS_DOCUMENTO:
+        errores.append(f"tipoDocumentoIdentificacion inválido: {usuario.get('tipoDocumentoIdentificacion')!r}")
+    if usuario.get("tipoUsuario") not in TIPOS_USUARIO:
+        errores.append(f"tipoUsuario inválido: {usuario.get('tipoUsuario')!r}")
+    if usuario.get("codSexo") not in CODIGOS_SEXO:
+        errores.append(f"codSexo inválido: {usuario.get('codSexo')!r}")
+    if not _fecha_valida(usuario.get("fechaNacimiento")):
+        errores.append(f"fechaNacimiento inválida: {usuario.get('fechaNacimiento')!r}")
+    return errores
+
+
+# Solo se validan los servicios con reglas conocidas; medicamentos,
+# otrosServicios, etc. usan otros campos de fecha y de valor
+SERVICIOS_VALIDADOS = ("consultas", "procedimientos")
+
+
+def _es_importe(valor):
+    # json acepta NaN e Infinity, que dañarían los totales
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor)
+
+
+def validar_servicio(tipo, servicio):
+    if not isinstance(servicio, dict):
+        return [f"el registro de {tipo} no es un objeto JSON: {servicio!r}"]
+    if tipo not in SERVICIOS_VALIDADOS:
+        return []
+    errores = []
+    if servicio.get("tipoDocumentoIdentificacion") not in TIPOS_DOCUMENTO:
+        errores.append(f"tipoDocumentoIdentificacion inválido: {servicio.get('tipoDocumentoIdentificacion')!r}")
+    if servicio.get("conceptoRecaudo") not in CONCEPTOS_RECAUDO:
+        errores.append(f"conceptoRecaudo inválido: {servicio.get('conceptoRecaudo')!r}")
+    if not _fecha_hora_valida(servicio.get("fechaInicioAtencion")):
+        errores.append(f"fechaInicioAtencion inválida: {servicio.get('fechaInicioAtencion')!r}")
+    for campo in ("vrServicio", "valorPagoModerador"):
+        valor = servicio.get(campo)
+        if not _es_importe(valor) or valor < 0:
+            errores.append(f"{campo} inválido: {valor!r}")
+    return errores
+
+
+# 📊 Totales por prestador, procedimiento/consulta y diagnóstico
+
+# Marca para los servicios que no tienen el campo de una agrupación (por
+# ejemplo codConsulta en un procedimiento); esas filas no suman en ella
+_NO_APLICA = "\0"
+
+
+class AcumuladorTotales:
+    """Suma vrServicio y valorPagoModerador de consultas y procedimientos por
+    lotes con numpy.
+
+    Solo se guardan en memoria los servicios del lote actual y una fila de
+    totales por código distinto, así que el consumo no depende del tamaño
+    del archivo.
+    """
+
+    AGRUPACIONES = ("codPrestador", "codProcedimiento", "codConsulta", "codDiagnosticoPrincipal")
+
+    def __init__(self, tamano_lote=100_000):
+        self.tamano_lote = tamano_lote
+        self._claves = {campo: [] for campo in self.AGRUPACIONES}
+        self._vr_servicio = []
+        self._valor_moderador = []
+        # campo -> {codigo: [vrServicio, valorPagoModerador, cantidad]}
+        self.totales = {campo: {} for campo in self.AGRUPACIONES}
+
+    def agregar(self, servicio):
+        for campo, claves in self._claves.items():
+            claves.append(str(servicio[campo]) if campo in servicio else _NO_APLICA)
+        # Los valores no numéricos ya se reportan en la validación; aquí cuentan como 0
+        vr_servicio = servicio.get("vrServicio")
+        valor_moderador = servicio.get("valorPagoModerador")
+        self._vr_servicio.append(vr_servicio if _es_importe(vr_servicio) else 0)
+        self._valor_moderador.append(valor_moderador if _es_importe(valor_moderador) else 0)
+        if len(self._vr_servicio) >= self.tamano_lote:
+            self.vaciar()
+
+    def vaciar(self):
+        if not self._vr_servicio:
+            return
+        vr_servicio = np.asarray(self._vr_servicio, dtype=np.float64)
+        valor_moderador = np.asarray(self._valor_moderador, dtype=np.float64)
+        for campo, claves in self._claves.items():
+            codigos, indices = np.unique(np.asarray(claves, dtype=object), return_inverse=True)
+            n = len(codigos)
+            sumas_vr = np.bincount(indices, weights=vr_servicio, minlength=n)
+            sumas_moderador = np.bincount(indices, weights=valor_moderador, minlength=n)
+            cantidades = np.bincount(indices, minlength=n)
+            totales = self.totales[campo]
+            for codigo, vr, moderador, cantidad in zip(
+                codigos.tolist(), sumas_vr.tolist(), sumas_moderador.tolist(), cantidades.tolist()
+            ):
+                if codigo == _NO_APLICA:
+                    continue
+                fila = totales.get(codigo)
+                if fila is None:
+                    totales[codigo] = [vr, moderador, cantidad]
+                else:
+                    fila[0] += vr
+                    fila[1] += moderador
+                    fila[2] += cantidad
+            claves.clear()
+        self._vr_servicio.clear()
+        self._valor_moderador.clear()
+
+
+def procesar_rips(archivo, tamano_lote=100_000, max_errores=1000):
+    """Valida y totaliza un RIPS en una sola pasada con memoria acotada.
+
+    Devuelve un diccionario con el encabezado, los conteos, los totales de
+    consultas y procedimientos por codPrestador / codProcedimiento /
+    codConsulta / codDiagnosticoPrincipal y hasta
+    ``max_errores`` errores de validación (el conteo total va en num_errores).
+    """
+    acumulador = AcumuladorTotales(tamano_lote)
+    errores = []
+    num_errores = 0
+    num_usuarios = 0
+    num_procedimientos = 0
+    num_consultas = 0
+    num_servicios = 0
+    encabezado = {}
+
+    for tipo, registro in leer_rips(archivo):
+        if tipo == "usuario":
+            num_usuarios += 1
+            problemas = validar_usuario(registro)
+            ubicacion = f"usuario {num_usuarios}"
+        elif tipo == "documento":
+            encabezado = registro
+            continue
+        else:
+            num_servicios += 1
+            problemas = validar_servicio(tipo, registro)
+            es_objeto = isinstance(registro, dict)
+            consecutivo = registro.get("consecutivo") if es_objeto else None
+            ubicacion = f"usuario {num_usuarios + 1}, {tipo} consecutivo {consecutivo}"
+            if tipo == "procedimientos":
+                num_procedimientos += 1
+            elif tipo == "consultas":
+                num_consultas += 1
+            if es_objeto and tipo in SERVICIOS_VALIDADOS:
+                acumulador.agregar(registro)
+        if problemas:
+            num_errores += len(problemas)
+            for problema in problemas:
+                if len(errores) < max_errores:
+                    errores.append(f"{ubicacion}: {problema}")
+    acumulador.vaciar()
+
+    return {
+        "encabezado": encabezado,
+        "num_usuarios": num_usuarios,
+        "num_servicios": num_servicios,
+        "num_procedimientos": num_procedimientos,
+        "num_consultas": num_consultas,
+        "num_errores": num_errores,
+        "errores": errores,
+        "totales": acumulador.totales,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    for ruta in sys.argv[1:]:
+        resultado = procesar_rips(ruta)
+        print(f"📄 {ruta}")
+        print(f"  Usuarios: {resultado['num_usuarios']}")
+        print(f"  Consultas: {resultado['num_consultas']}")
+        print(f"  Procedimientos: {resultado['num_procedimientos']}")
+        for campo, totales in resultado["totales"].items():
+            if not totales:
+                continue
+            print(f"  Totales de consultas y procedimientos por {campo}:")
+            for codigo, (vr, moderador, cantidad) in sorted(totales.items()):
+                print(f"    {codigo}: vrServicio={vr:,.0f} valorPagoModerador={moderador:,.0f} ({cantidad})")
+        if resultado["num_errores"]:
+            print(f"⚠️ {resultado['num_errores']} errores de validación:")
+            for error in resultado["errores"]:
+                print(f"    {error}")
+        else:
+            print("✅ Sin errores de validación")
@@ -0,0 +1,227 @@
+import copy
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import rips_lote
+from rips_lote import generar_lote
+
+RAIZ = Path(__file__).parent
+FACTURAS_EJEMPLO = json.loads((RAIZ / "fixtures" / "facturas_ejemplo.json").read_text(encoding="utf-8"))
+
+
+def _factura(numero, vr_servicio=1000):
+    return {
+        "numDocumentoIdObligado": "51938676",
+        "codPrestador": "110010231001",
+        "numFactura": f"F{numero}",
+        "usuarios": [{
+            "tipoDocumento": "CC",
+            "numDocumento": str(1000 + numero),
+            "fechaNacimiento": "1990-01-01",
+            "codSexo": "F",
+            "PaisResidencia": "170",
+            "MunicipioResidencia": "11001",
+            "ZonaResidencia": "02",
+            "PaisOrigen": "170",
+        }],
+        "procedimientos": [{
+            "IDPaciente": str(1000 + numero),
+            "fechaInicioAtencion": "2026-01-08 00:00",
+            "numAutorizacion": "123",
+            "CUPS": "931001",
+            "codServicio": 739,
+            "CIE10_Principal": "M754",
+            "vrServicio": vr_servicio,
+            "valorPagoModerador": 0,
+        }],
+    }
+
+
+@pytest.mark.parametrize("ejemplo, salida", [
+    ("fev_rips_generado.json", "SVER238.json"),
+    ("rips_generado.json", "RS_99301-112025.json"),
+])
+def test_reconstruye_los_rips_de_ejemplo(tmp_path, ejemplo, salida):
+    resumen = generar_lote([FACTURAS_EJEMPLO[ejemplo]], tmp_path, procesos=1)
+    assert resumen["generados"] == 1 and not resumen["errores"] and not resumen["advertencias"]
+    esperado = json.loads((RAIZ / ejemplo).read_text(encoding="utf-8"))
+    assert json.loads((tmp_path / salida).read_text(encoding="utf-8")) == esperado
+
+
+def test_dos_corridas_producen_lo_mismo(tmp_path):
+    facturas = [_factura(n) for n in range(20)]
+    generar_lote(facturas, tmp_path / "a", procesos=2, tamano_tanda=7)
+    generar_lote(facturas, tmp_path / "b", procesos=2, tamano_tanda=7)
+    for archivo in (tmp_path / "a").glob("*.json"):
+        assert archivo.read_bytes() == (tmp_path / "b" / archivo.name).read_bytes()
+
+
+def test_solo_se_regenera_la_factura_modificada(tmp_path):
+    facturas = [_factura(n) for n in range(10)]
+    generar_lote(facturas, tmp_path, procesos=2)
+    facturas[3] = _factura(3, vr_servicio=2000)
+
+    resumen = generar_lote(facturas, tmp_path, procesos=2)
+
+    assert resumen["generados"] == 1
+    assert resumen["sin_cambios"] == 9
+    # El usuario no cambió, así que su fragmento sale de la caché
+    assert resumen["fragmentos_nuevos"] == 1
+    assert resumen["fragmentos_reutilizados"] == 1
+    documento = json.loads((tmp_path / "F3.json").read_text(encoding="utf-8"))
+    assert documento["usuarios"][0]["servicios"]["procedimientos"][0]["vrServicio"] == 2000
+
+
+def test_documentos_repetidos_se_omiten(tmp_path):
+    facturas = [_factura(1)] + [copy.deepcopy(_factura(1)) for _ in range(39)]
+    resumen = generar_lote(facturas, tmp_path, procesos=4, tamano_tanda=8)
+    assert resumen["generados"] == 1
+    assert len(resumen["advertencias"]) == 39
+    assert [p.name for p in tmp_path.glob("*.json")] == ["F1.json"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_una_factura_con_error_no_detiene_el_lote(tmp_path):
+    facturas = [_factura(n) for n in range(5)]
+    del facturas[2]["usuarios"][0]["tipoDocumento"]
+    resumen = generar_lote(facturas, tmp_path, procesos=2)
+    assert resumen["generados"] == 4
+    assert resumen["errores"] == ["❌ F2: columna faltante 'tipoDocumento'"]
+
+
+def test_la_cache_se_limpia_de_fragmentos_sin_uso(tmp_path):
+    generar_lote([_factura(n) for n in range(5)], tmp_path, procesos=1)
+    resumen = generar_lote([_factura(n, vr_servicio=5) for n in range(2)], tmp_path, procesos=1)
+    # Quedan 2 usuarios y 2 procedimientos nuevos; el resto ya no se usa
+    assert resumen["fragmentos_borrados"] == 8
+    with sqlite3.connect(tmp_path / ".rips_cache.sqlite") as conexion:
+        assert conexion.execute("SELECT COUNT(*) FROM fragmentos").fetchone() == (4,)
+        assert conexion.execute("SELECT COUNT(*) FROM documentos").fetchone() == (2,)
+
+
+def test_version_de_formato_cambia_las_huellas(monkeypatch):
+    antes = rips_lote._huella({"a": 1})
+    monkeypatch.setattr(rips_lote, "VERSION_FORMATO", rips_lote.VERSION_FORMATO + 1)
+    assert rips_lote._huella({"a": 1}) != antes
+
+
+def test_factura_y_su_nota_en_el_mismo_lote(tmp_path):
+    nota = _factura(1, vr_servicio=-500)
+    nota.update(tipoNota="NC", numNota="NC77")
+    resumen = generar_lote([_factura(1), nota], tmp_path, procesos=2)
+    assert resumen["generados"] == 2 and not resumen["advertencias"] and not resumen["errores"]
+
+    factura = json.loads((tmp_path / "F1.json").read_text(encoding="utf-8"))
+    assert (factura["numFactura"], factura["tipoNota"], factura["numNota"]) == ("F1", "", "")
+    documento_nota = json.loads((tmp_path / "NC_NC77.json").read_text(encoding="utf-8"))
+    assert (documento_nota["numFactura"], documento_nota["tipoNota"], documento_nota["numNota"]) == ("F1", "NC", "NC77")
+    # Una nota asociada a una FEV conserva los valores
+    assert documento_nota["usuarios"][0]["servicios"]["procedimientos"][0]["vrServicio"] == -500
+
+
+@pytest.mark.parametrize("num_factura", [None, "", float("nan"), "nan", "../escape", "a\\b", ".."])
+def test_numero_de_documento_invalido_es_error(tmp_path, num_factura):
+    facturas = [_factura(1), _factura(2)]
+    for factura in facturas:
+        factura["numFactura"] = num_factura
+    resumen = generar_lote(facturas, tmp_path / "salida", procesos=1)
+    assert resumen["generados"] == 0 and not resumen["advertencias"]
+    assert len(resumen["errores"]) == 2
+    assert not list(tmp_path.rglob("*.json"))
+
+
+def test_nota_sin_numero_es_error(tmp_path):
+    factura = _factura(1)
+    factura["tipoNota"] = "NC"
+    resumen = generar_lote([factura], tmp_path, procesos=1)
+    assert resumen["errores"] == ["❌ Factura inválida: nota NC sin numNota"]
+
+
+def test_escritura_fallida_no_deja_temporales(tmp_path, monkeypatch):
+    def falla(origen, destino):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(rips_lote.os, "replace", falla)
+    with pytest.raises(OSError):
+        rips_lote._escribir_documento(str(tmp_path / "F1.json"), {"numFactura": "F1"}, ['{"a":1}'], [{}])
+    assert not list(tmp_path.iterdir())
+
+
+# Mismo orden de campos y constantes que los generadores desde Excel
+CAMPOS_CONSULTA = [
+    "codPrestador", "fechaInicioAtencion", "numAutorizacion", "codConsulta", "modalidadGrupoServicioTecSal",
+    "grupoServicios", "codServicio", "finalidadTecnologiaSalud", "causaMotivoAtencion", "codDiagnosticoPrincipal",
+    "codDiagnosticoRelacionado1", "codDiagnosticoRelacionado2", "codDiagnosticoRelacionado3",
+    "tipoDiagnosticoPrincipal", "tipoDocumentoIdentificacion", "numDocumentoIdentificacion", "vrServicio",
+    "valorPagoModerador", "conceptoRecaudo", "numFEVPagoModerador", "consecutivo",
+]
+
+
+def _con_consulta(factura):
+    factura["consultas"] = [{
+        "IDPaciente": factura["usuarios"][0]["numDocumento"],
+        "fechaInicioAtencion": "2026-01-08 09:30:00",
+        "numAutorizacion": 4455,
+        "CUPS": 890203,
+        "codServicio": 334.0,
+        "finalidadTecnologiaSalud": "11",
+        "causaMotivoAtencion": "38",
+        "CIE10_Principal": "K021",
+        "CIE10_relacionado1": "K053",
+        "CIE10_relacionado2": float("nan"),
+        "CIE10_relacionado3": None,
+        "tipoDiagnosticoPrincipal": "01",
+        "vrServicio": 45000.0,
+        "valorPagoModerador": 4500,
+    }]
+    return factura
+
+
+def test_consultas_de_factura_fev(tmp_path):
+    generar_lote([_con_consulta(_factura(1))], tmp_path, procesos=1)
+    usuario = json.loads((tmp_path / "F1.json").read_text(encoding="utf-8"))["usuarios"][0]
+    assert list(usuario["servicios"]) == ["consultas", "procedimientos"]
+    consulta = usuario["servicios"]["consultas"][0]
+    assert list(consulta) == CAMPOS_CONSULTA
+    assert consulta == {
+        "codPrestador": "110010231001",
+        "fechaInicioAtencion": "2026-01-08 09:30",
+        "numAutorizacion": "4455",
+        "codConsulta": "890203",
+        "modalidadGrupoServicioTecSal": "01",
+        "grupoServicios": "01",
+        "codServicio": 334,
+        "finalidadTecnologiaSalud": "11",
+        "causaMotivoAtencion": "38",
+        "codDiagnosticoPrincipal": "K021",
+        "codDiagnosticoRelacionado1": "K053",
+        "codDiagnosticoRelacionado2": None,
+        "codDiagnosticoRelacionado3": None,
+        "tipoDiagnosticoPrincipal": "01",
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": "51938676",
+        "vrServicio": 45000,
+        "valorPagoModerador": 4500,
+        "conceptoRecaudo": "03",
+        "numFEVPagoModerador": "",
+        "consecutivo": 1,
+    }
+
+
+def test_consultas_de_nota_rs_sin_fev(tmp_path):
+    nota = _con_consulta(_factura(1))
+    nota.update(numFactura=None, tipoNota="RS", numNota="99301-112025")
+    generar_lote([nota], tmp_path, procesos=1)
+    documento = json.loads((tmp_path / "RS_99301-112025.json").read_text(encoding="utf-8"))
+    assert (documento["numFactura"], documento["tipoNota"], documento["numNota"]) == (None, "RS", "99301-112025")
+    usuario = documento["usuarios"][0]
+    assert usuario["tipoUsuario"] == "12"
+    consulta = usuario["servicios"]["consultas"][0]
+    assert list(consulta) == CAMPOS_CONSULTA
+    assert consulta["numAutorizacion"] == ""
+    assert (consulta["vrServicio"], consulta["valorPagoModerador"]) == (0, 0)
+    assert consulta["conceptoRecaudo"] == "05"
+    assert consulta["codDiagnosticoRelacionado2"] is None
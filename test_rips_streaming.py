@@ -0,0 +1,123 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from rips_streaming import ErrorFormatoRIPS, leer_rips, procesar_rips
+
+RAIZ = Path(__file__).parent
+EJEMPLOS = ["rips_generado.json", "fev_rips_generado.json", "rips_drOrdonez.json"]
+
+
+def _como_json_load(documento):
+    """Los mismos eventos que leer_rips, construidos a partir de json.load."""
+    eventos = []
+    for usuario in documento["usuarios"]:
+        for tipo, servicios in usuario.get("servicios", {}).items():
+            eventos.extend((tipo, servicio) for servicio in servicios)
+        eventos.append(("usuario", {k: v for k, v in usuario.items() if k != "servicios"}))
+    eventos.append(("documento", {k: v for k, v in documento.items() if k != "usuarios"}))
+    return eventos
+
+
+def _documento(procedimiento=None, **usuario):
+    base = json.loads((RAIZ / "rips_drOrdonez.json").read_text(encoding="utf-8"))
+    base["usuarios"][0].update(usuario)
+    if procedimiento is not None:
+        base["usuarios"][0]["servicios"]["procedimientos"][0].update(procedimiento)
+    return base
+
+
+def _procesar(documento):
+    return procesar_rips(io.BytesIO(json.dumps(documento, ensure_ascii=False).encode("utf-8")))
+
+
+@pytest.mark.parametrize("nombre", EJEMPLOS)
+@pytest.mark.parametrize("tamano_bloque", [1, 2, 7, 1 << 20])
+def test_leer_rips_igual_a_json_load(nombre, tamano_bloque):
+    contenido = (RAIZ / nombre).read_bytes()
+    eventos = list(leer_rips(io.BytesIO(contenido), tamano_bloque))
+    assert eventos == _como_json_load(json.loads(contenido))
+
+
+@pytest.mark.parametrize("tamano_bloque", [1, 2, 7])
+def test_caracteres_multibyte_y_numeros_cortados_entre_bloques(tamano_bloque):
+    documento = {
+        "numDocumentoIdObligado": 123456789,
+        "usuarios": [{"nombre": "ñandú €", "servicios": {"procedimientos": [{"vrServicio": 1.5e3}]}}],
+    }
+    contenido = json.dumps(documento, ensure_ascii=False).encode("utf-8")
+    assert list(leer_rips(io.BytesIO(contenido), tamano_bloque)) == _como_json_load(documento)
+
+
+def test_error_de_sintaxis_se_reporta_sin_leer_el_resto():
+    relleno = json.dumps([{"x": "a" * 100}] * 50_000)
+    archivo = io.BytesIO(f'{{"a": 1, "b": {{"c": 1,}}, "relleno": {relleno}}}'.encode("utf-8"))
+    with pytest.raises(ErrorFormatoRIPS, match="caracter"):
+        list(leer_rips(archivo, tamano_bloque=1024))
+    assert archivo.tell() <= 2048
+
+
+def test_utf8_invalido_es_error_de_formato():
+    with pytest.raises(ErrorFormatoRIPS, match="UTF-8 inválido.*caracter 6"):
+        list(leer_rips(io.BytesIO(b'{"a":"\xff"}'), tamano_bloque=2))
+
+
+def test_registros_que_no_son_objetos_se_reportan():
+    documento = _documento()
+    documento["usuarios"].append(5)
+    documento["usuarios"][0]["servicios"]["procedimientos"].append(1)
+    resultado = _procesar(documento)
+    assert resultado["num_errores"] == 2
+    assert any("procedimientos no es un objeto" in error for error in resultado["errores"])
+    assert any("usuario no es un objeto" in error for error in resultado["errores"])
+    assert resultado["totales"]["codPrestador"] == {"110010136201": [2672000.0, 0.0, 1]}
+
+
+@pytest.mark.parametrize("valor", ["abc", "1000", {"a": 1}, [[1]], True, None, float("nan"), float("inf")])
+def test_valores_no_numericos_se_reportan_y_no_se_suman(valor):
+    resultado = _procesar(_documento({"vrServicio": valor}))
+    assert resultado["num_errores"] == 1
+    assert "vrServicio inválido" in resultado["errores"][0]
+    assert resultado["totales"]["codProcedimiento"] == {"814731": [0.0, 0.0, 1]}
+
+
+def test_servicios_sin_reglas_no_generan_errores_falsos():
+    documento = _documento()
+    documento["usuarios"][0]["servicios"]["medicamentos"] = [
+        {"fechaDispensAdmon": "2025-09-30 07:00", "vrUnitMedicamento": 100}
+    ]
+    assert _procesar(documento)["num_errores"] == 0
+
+
+def test_codigos_y_fechas_invalidos():
+    resultado = _procesar(_documento(
+        {"conceptoRecaudo": "9", "fechaInicioAtencion": "2025-09-30"},
+        codSexo="X",
+        fechaNacimiento="1973-02-30",
+    ))
+    assert resultado["num_errores"] == 4
+
+
+def test_consultas_suman_en_los_totales():
+    documento = _documento()
+    documento["usuarios"][0]["servicios"]["consultas"] = [{
+        "codPrestador": "110010136201",
+        "fechaInicioAtencion": "2025-09-30 07:00",
+        "codConsulta": "890203",
+        "tipoDocumentoIdentificacion": "CC",
+        "codDiagnosticoPrincipal": "M239",
+        "vrServicio": 50000,
+        "valorPagoModerador": 4500,
+        "conceptoRecaudo": "03",
+        "consecutivo": 1,
+    }]
+    resultado = _procesar(documento)
+    assert resultado["num_errores"] == 0
+    assert resultado["num_consultas"] == 1
+    totales = resultado["totales"]
+    assert totales["codPrestador"] == {"110010136201": [2722000.0, 4500.0, 2]}
+    assert totales["codDiagnosticoPrincipal"] == {"M239": [2722000.0, 4500.0, 2]}
+    assert totales["codProcedimiento"] == {"814731": [2672000.0, 0.0, 1]}
+    assert totales["codConsulta"] == {"890203": [50000.0, 4500.0, 1]}